@@ -534,11 +534,18 @@ async def lifespan(app: FastAPI):
 
     asyncio.create_task(periodic_usage_pool_cleanup())
 
+    yq_answers.start_log_writer()
+
     yield
 
     if hasattr(app.state, "redis_task_command_listener"):
         app.state.redis_task_command_listener.cancel()
 
+    await yq_answers.stop_log_writer()
+    await yq_answers.embedding_batcher.close()
+    await yq_answers.close_clients()
+    yq_answers.shutdown_pii_pool()
+
 
 app = FastAPI(
     title="Open WebUI",
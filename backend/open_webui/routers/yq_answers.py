@@ -1,12 +1,25 @@
 import os
+import asyncio
 import re
 import csv
+import hashlib
 import logging
-from typing import List
+import multiprocessing
+import threading
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator, List, Optional, Sequence
+
+import anyio
+import httpx
+import orjson
+from cachetools import LRUCache, TTLCache
 from fastapi import APIRouter, Depends, HTTPException, Security
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.security.api_key import APIKeyHeader
 from pydantic import BaseModel
-from openai import OpenAI
+from openai import NOT_GIVEN, AsyncOpenAI, DefaultAsyncHttpxClient, OpenAIError
 from pinecone import Pinecone
 from presidio_analyzer import AnalyzerEngine
 from presidio_anonymizer import AnonymizerEngine
@@ -16,10 +29,48 @@ from pinecone.openapi_support.exceptions import PineconeApiException
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Presidio setup
-analyzer = AnalyzerEngine()
+# PII setup: a single compiled pattern covers the structured PII types we
+# see in queries. Presidio (spaCy NER) is only loaded when explicitly enabled;
+# without it, names (PERSON) and places (LOCATION) are not anonymized.
+YQ_PII_USE_PRESIDIO = os.getenv("YQ_PII_USE_PRESIDIO", "False").lower() == "true"
+
+# Group names double as the replacement placeholders, matching Presidio's
+_PII_RE = re.compile(
+    "|".join(
+        f"(?P<{entity}>{pattern})"
+        for entity, pattern in (
+            ("EMAIL_ADDRESS", r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}"),
+            ("US_SSN", r"\b\d{3}-\d{2}-\d{4}\b"),
+            ("CREDIT_CARD", r"\b(?:\d[ -]?){12,18}\d\b"),
+            (
+                "IP_ADDRESS",
+                r"\b(?:(?:25[0-5]|2[0-4]\d|1?\d?\d)\.){3}(?:25[0-5]|2[0-4]\d|1?\d?\d)\b",
+            ),
+            # Bare digit runs (hadith numbers, ISBNs) need a "+" country code
+            # or separators between the groups to count as a phone number
+            (
+                "PHONE_NUMBER",
+                r"(?<![\w+])(?:\+\d{1,3}[ .-]?\d{3}[ .-]?\d{3}[ .-]?\d{4}"
+                r"|(?:\(\d{3}\) ?|\d{3}[ .-])\d{3}[ .-]\d{4})\b",
+            ),
+            ("IBAN_CODE", r"\b[A-Z]{2}\d{2}(?: ?[A-Z0-9]{4}){2,7}(?: ?[A-Z0-9]{1,3})?\b"),
+        )
+    )
+)
+
+# The analyzer loads spaCy, so it is only built the first time it is needed
+_analyzer: Optional[AnalyzerEngine] = None
+_analyzer_lock = threading.Lock()
 anonymizer = AnonymizerEngine()
 
+def _get_analyzer() -> AnalyzerEngine:
+    global _analyzer
+    if _analyzer is None:
+        with _analyzer_lock:
+            if _analyzer is None:
+                _analyzer = AnalyzerEngine()
+    return _analyzer
+
 # Authentication setup
 API_KEY = os.getenv("YQ_CHAT_API_KEY")
 logger.info(f"API Key loaded from env: {'Present' if API_KEY else 'Not present'}")
@@ -34,104 +85,287 @@ async def get_api_key(api_key: str = Security(api_key_header)):
         return api_key
     raise HTTPException(status_code=403, detail="Could not validate credentials")
 
-router = APIRouter()
+# Initialize clients; OpenAI gets a large keep-alive pool so concurrent
+# requests reuse warm TLS connections instead of opening new ones
+HTTP_MAX_CONNECTIONS = 200
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 100
 
-# Initialize clients
-client = OpenAI(api_key=os.getenv("YQ_OPENAI_API_KEY"))
+# DefaultAsyncHttpxClient keeps the SDK's own defaults (redirects etc.)
+http_client = DefaultAsyncHttpxClient(
+    http2=True,
+    limits=httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    ),
+    timeout=httpx.Timeout(30.0, connect=5.0),
+)
+client = AsyncOpenAI(api_key=os.getenv("YQ_OPENAI_API_KEY"), http_client=http_client)
 pc = Pinecone(api_key=os.getenv("YQ_PINECONE_API_KEY"), environment="us-east-1")
-index = pc.Index("yq-transcripts-all")
+PINECONE_INDEX_NAME = "yq-transcripts-all"
+PINECONE_TOP_K = int(os.getenv("YQ_PINECONE_TOP_K", "3"))
+
+# Only these metadata fields are used to build the context and sources
+PINECONE_METADATA_FIELDS = ("text", "Link", "Title")
+
+# Optionally request shortened (Matryoshka-truncated) embeddings to shrink
+# the vector sent to Pinecone; must match the dimension of the index
+EMBEDDING_DIMENSIONS = os.getenv("YQ_EMBEDDING_DIMENSIONS")
+EMBEDDING_DIMENSIONS = int(EMBEDDING_DIMENSIONS) if EMBEDDING_DIMENSIONS else None
+
+# The asyncio index handles need the index host and a running event loop,
+# so they are resolved on first use rather than at import time.
+_indexes = {}
+
+async def get_index(index_name: str):
+    if index_name not in _indexes:
+        host = await anyio.to_thread.run_sync(
+            lambda: pc.describe_index(index_name).host
+        )
+        if index_name not in _indexes:
+            _indexes[index_name] = pc.IndexAsyncio(host=host)
+    return _indexes[index_name]
+
+# Function to close the OpenAI connection pool and the Pinecone index
+# sessions, called on app shutdown
+async def close_clients() -> None:
+    await client.close()
+    for index in _indexes.values():
+        await index.close()
+    _indexes.clear()
+
+# Resolve the index handle ahead of the search; failures are retried there
+async def prefetch_index(index_name: str) -> None:
+    try:
+        await get_index(index_name)
+    except Exception as e:
+        logger.warning(f"Pinecone index prefetch failed: {e}")
+
+# Matches the start second of a "[12.3 – 45.6]" transcript timestamp
+_TS_RE = re.compile(r"\[\s*([0-9.]+)\s*–")
+
+# Caches for repeated queries: normalized query -> embedding, and
+# embedding digest -> Pinecone metadata (expires so index updates show up).
+# Embeddings are stored as packed float32 arrays (~12 KiB each at 3072 dims)
+# rather than tuples of boxed floats, which are ~8x larger.
+_embedding_cache = LRUCache(maxsize=4096)
+_search_cache = TTLCache(maxsize=2048, ttl=600)
+
+# Function to normalize a query for cache lookups
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
 
 # Function to detect PII in text
 def detect_pii_entities(text: str):
-    return analyzer.analyze(text, language='en')
+    return _get_analyzer().analyze(text, language='en')
+
+# Function to check a card number's Luhn checksum, as Presidio does
+def luhn_valid(number: str) -> bool:
+    digits = [int(c) for c in number if c.isdigit()]
+    total = sum(digits[-1::-2])
+    total += sum(d * 2 - 9 if d > 4 else d * 2 for d in digits[-2::-2])
+    return total % 10 == 0
+
+# Function to swap a PII match for its placeholder; digit runs that fail the
+# card checksum (Hijri year lists, ISBNs) are left untouched
+def _replace_pii(match: re.Match) -> str:
+    if match.lastgroup == "CREDIT_CARD" and not luhn_valid(match.group()):
+        return match.group()
+    return f"<{match.lastgroup}>"
 
 # Function to anonymize text
 def anonymize_text(text: str) -> str:
-    entities = detect_pii_entities(text)
-    result = anonymizer.anonymize(text=text, analyzer_results=entities)
-    return result.text
+    if YQ_PII_USE_PRESIDIO:
+        entities = detect_pii_entities(text)
+        result = anonymizer.anonymize(text=text, analyzer_results=entities)
+        return result.text
+    return _PII_RE.sub(_replace_pii, text)
+
+# Presidio holds the GIL for tens of milliseconds per call, so it runs in a
+# small process pool whose workers each build their own analyzer up front.
+# Workers come from a forkserver rather than forking the threaded server.
+PII_PROCESS_WORKERS = 2
+_pii_pool: Optional[ProcessPoolExecutor] = None
+_pii_pool_lock = threading.Lock()
+
+def _init_presidio() -> None:
+    _get_analyzer()
+
+def _get_pii_pool() -> ProcessPoolExecutor:
+    global _pii_pool
+    with _pii_pool_lock:
+        if _pii_pool is None:
+            _pii_pool = ProcessPoolExecutor(
+                max_workers=PII_PROCESS_WORKERS,
+                mp_context=multiprocessing.get_context("forkserver"),
+                initializer=_init_presidio,
+            )
+        return _pii_pool
+
+# Function to drop a pool whose worker died so the next call builds a new one
+def _discard_pii_pool(pool: ProcessPoolExecutor) -> None:
+    global _pii_pool
+    with _pii_pool_lock:
+        if _pii_pool is pool:
+            _pii_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def shutdown_pii_pool() -> None:
+    global _pii_pool
+    with _pii_pool_lock:
+        pool, _pii_pool = _pii_pool, None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+
+# Function to anonymize the user query, keeping Presidio off the event loop
+async def anonymize_query(text: str) -> str:
+    if YQ_PII_USE_PRESIDIO:
+        loop = asyncio.get_running_loop()
+        pool = _get_pii_pool()
+        try:
+            return await loop.run_in_executor(pool, anonymize_text, text)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); rebuild the pool once
+            logger.warning("Presidio process pool broke, restarting it")
+            _discard_pii_pool(pool)
+            return await loop.run_in_executor(_get_pii_pool(), anonymize_text, text)
+    return anonymize_text(text)
 
 # Function to extract start seconds from text
 def extract_start_sec(text: str) -> int:
-    match = re.search(r"\[\s*([0-9.]+)\s*–", text)
+    match = _TS_RE.search(text)
     if match:
         try:
             return int(float(match.group(1)))
-        except:
+        except (TypeError, ValueError):
             return 0
     return 0
 
+# Function to top up a batch from a queue until it is full or max_wait passes
+async def fill_batch(queue: asyncio.Queue, batch: list, max_size: int, max_wait: float) -> None:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max_wait
+    while len(batch) < max_size:
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            break
+        try:
+            batch.append(await asyncio.wait_for(queue.get(), timeout))
+        except asyncio.TimeoutError:
+            break
+
+# Collects concurrent embedding requests and sends them to OpenAI as one
+# batched call, flushing after max_wait seconds or max_batch_size queries
+class EmbeddingBatcher:
+    def __init__(
+        self,
+        model: str = "text-embedding-3-large",
+        dimensions: Optional[int] = None,
+        max_batch_size: int = 32,
+        max_wait: float = 0.015,
+    ):
+        self.model = model
+        self.dimensions = dimensions
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = None
+        self._task = None
+        self._flushes = set()
+
+    async def submit(self, query: str) -> List[float]:
+        # The collector task is bound to the running loop, so start it lazily
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._collect())
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((query, future))
+        return await future
+
+    async def close(self) -> None:
+        tasks = [task for task in (self._task, *self._flushes) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+    async def _collect(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            await fill_batch(self._queue, batch, self.max_batch_size, self.max_wait)
+
+            # Flush in the background so the next batch can start collecting
+            flush = asyncio.create_task(self._flush(batch))
+            self._flushes.add(flush)
+            flush.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: list) -> None:
+        try:
+            response = await client.embeddings.create(
+                model=self.model,
+                input=[query for query, _ in batch],
+                dimensions=self.dimensions or NOT_GIVEN,
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for item in response.data:
+            future = batch[item.index][1]
+            if not future.done():
+                future.set_result(item.embedding)
+
+embedding_batcher = EmbeddingBatcher(dimensions=EMBEDDING_DIMENSIONS)
+
 # Function to embed the query
-def embed_query(query: str) -> List[float]:
+async def embed_query(query: str) -> Sequence[float]:
+    key = normalize_query(query)
+    embedding = _embedding_cache.get(key)
+    if embedding is not None:
+        return embedding
+
     try:
-        response = client.embeddings.create(
-            model="text-embedding-3-large",
-            input=[query]
-        )
-        return response.data[0].embedding
-    except PineconeApiException as e:
-        logger.error(f"Pinecone embed error: {e}")
+        embedding = array("f", await embedding_batcher.submit(query))
+        _embedding_cache[key] = embedding
+        return embedding
+    except OpenAIError as e:
+        logger.error(f"OpenAI embed error: {e}")
         return None
 
 # Function to query Pinecone index
-def search_pinecone(embedding: List[float], top_k: int = 3) -> List[dict]:
+async def search_pinecone(
+    embedding: Sequence[float], index_name: str, top_k: int = PINECONE_TOP_K
+) -> List[dict]:
+    key = (index_name, hashlib.sha1(array("d", embedding).tobytes()).hexdigest(), top_k)
+    cached = _search_cache.get(key)
+    if cached is not None:
+        return cached
+
     try:
-        results = index.query(
+        index = await get_index(index_name)
+        results = await index.query(
             namespace="ns1",
-            vector=embedding,
+            vector=list(embedding),
             top_k=top_k,
             include_values=False,
             include_metadata=True
         )
-        return [match["metadata"] for match in results.get("matches", [])]
+        # Keep only the fields we use so cached results stay small
+        metadata = [
+            {k: match["metadata"][k] for k in PINECONE_METADATA_FIELDS if k in match["metadata"]}
+            for match in results.get("matches", [])
+        ]
+        if metadata:
+            _search_cache[key] = metadata
+        return metadata
     except PineconeApiException as e:
         logger.error(f"Pinecone query error: {e}")
         return []
 
-# Function called by api.py to answer user text queries
-def answer_query(messages: List[dict]) -> str:
-    # Extract last user message
-    user_message = next((m["content"] for m in reversed(messages) if m["role"] == "user"), None)
-    if not user_message:
-        return "No user message found."
-
-    # Run PII detection before continuing (anonymize text)
-    query = anonymize_text(user_message)
-
-    # Embed the query
-    embedding = embed_query(query)
-    if not embedding:
-        return "Sorry, I couldn't process your request... (Backend Error - Embedding)"
-
-    # Query Pinecone
-    pinecone_results = search_pinecone(embedding)
-    if not pinecone_results:
-        return "Sorry, I couldn't process your request... (Backend Error - Search Pinecone)"
-
-    # Build context from pinecone results
-    context = "\n\n---\n\n".join([r.get("text", "") for r in pinecone_results])
-    sources = []
-    # Dictionary to store earliest timestamp for each unique video
-    video_timestamps = {}
-    
-    for r in pinecone_results:
-        link = r.get("Link")
-        text = r.get("text", "")
-        if link:
-            start_sec = extract_start_sec(text)
-            title = r.get("Title", "Video Link")
-            # If we haven't seen this video before or this timestamp is earlier
-            if link not in video_timestamps or start_sec < video_timestamps[link]["timestamp"]:
-                video_timestamps[link] = {
-                    "title": title,
-                    "timestamp": start_sec
-                }
-    
-    # Convert the deduplicated videos to source links
-    sources = [f"[{data['title']}]({link}&t={data['timestamp']})" 
-              for link, data in video_timestamps.items()]
-
-    system_prompt = """
+# System prompt is kept byte-identical across requests so that it forms a
+# stable prefix for OpenAI's prompt caching
+SYSTEM_PROMPT = """
     You are an Islamic Assistant that answers questions based on the teachings of Shaykh Dr. Yasir Qadhi.
 
     Guidelines:
@@ -149,64 +383,244 @@ def answer_query(messages: List[dict]) -> str:
     "That's not important — what truly matters is who created us all: Allah (SWT)."
     """
 
+# Shared by every request; treat as read-only
+SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+
+# Canned replies for bare greetings, matching what the system prompt asks for
+GREETING_REPLY = (
+    "Assalamualaikum Warahmatullahi Wabarakatuh\n\n"
+    "How are you doing today? What questions can I answer for you?"
+)
+SALAM_REPLY = "Wailikum Assalam Warahmatullahi Wabarakatuh"
+
+CANNED_REPLIES = {
+    **dict.fromkeys(
+        ("hi", "hii", "hey", "hello", "hi there", "hello there",
+         "good morning", "good afternoon", "good evening"),
+        GREETING_REPLY,
+    ),
+    **dict.fromkeys(
+        ("salam", "salaam", "salams", "as salam", "salam alaikum", "salaam alaikum",
+         "assalamualaikum", "asalamualaikum", "assalamu alaikum", "as-salamu alaykum",
+         "assalamualaikum warahmatullahi wabarakatuh"),
+        SALAM_REPLY,
+    ),
+}
+
+# Phrases marking an answer as a greeting or non-answer that gets no sources
+_CANNED_PHRASES = (
+    'assalamualaikum',
+    'wailikum assalam',
+    'allah and his messenger know best',
+    'that\'s not important — what truly matters is who created us all'
+)
+
+# Function to look up a canned reply for the user message, if any
+def canned_reply(user_message: str) -> Optional[str]:
+    return CANNED_REPLIES.get(normalize_query(user_message).strip("!.?, "))
+
+class ChatMessage(BaseModel):
+    role: str
+    content: str
+
+# Function called by the router to stream the answer to user text queries
+async def stream_answer(
+    messages: Sequence[ChatMessage],
+    index_name: str = PINECONE_INDEX_NAME,
+    system_message: dict = SYSTEM_MESSAGE,
+) -> AsyncIterator[str]:
+    # Extract last user message
+    user_message = next((m.content for m in reversed(messages) if m.role == "user"), None)
+    if not user_message:
+        yield "No user message found."
+        return
+
+    # Greetings get a fixed reply without anonymization, retrieval or the LLM
+    reply = canned_reply(user_message)
+    if reply is not None:
+        log_exchange(user_message, "", reply)
+        yield reply
+        return
+
+    # Task prompts (titles, tags, follow-ups) don't need transcript context
+    is_task = user_message.strip().startswith('### Task:')
+    context = ""
+    sources = []
+
+    if not is_task:
+        # Run PII detection before continuing (anonymize text). Overlap it with
+        # the Pinecone index lookup only when both actually wait on something:
+        # the regex path is inline and the index handle is usually cached.
+        if YQ_PII_USE_PRESIDIO and index_name not in _indexes:
+            query, _ = await asyncio.gather(
+                anonymize_query(user_message),
+                prefetch_index(index_name),
+            )
+        else:
+            query = await anonymize_query(user_message)
+
+        # Embed the query
+        embedding = await embed_query(query)
+        if not embedding:
+            yield "Sorry, I couldn't process your request... (Backend Error - Embedding)"
+            return
+
+        # Query Pinecone
+        pinecone_results = await search_pinecone(embedding, index_name)
+        if not pinecone_results:
+            yield "Sorry, I couldn't process your request... (Backend Error - Search Pinecone)"
+            return
+
+        # Build context and sources from pinecone results in a single pass
+        context_parts = []
+        # Maps each unique video link to its (title, earliest timestamp)
+        video_timestamps = {}
+
+        for r in pinecone_results:
+            text = r.get("text", "")
+            context_parts.append(text)
+
+            link = r.get("Link")
+            if not link:
+                continue
+            seen = video_timestamps.get(link)
+            # Nothing can be earlier than the start of the video
+            if seen is not None and seen[1] == 0:
+                continue
+            start_sec = extract_start_sec(text)
+            # If we haven't seen this video before or this timestamp is earlier
+            if seen is None or start_sec < seen[1]:
+                video_timestamps[link] = (r.get("Title", "Video Link"), start_sec)
+
+        context = "\n\n---\n\n".join(context_parts)
+
+        # Convert the deduplicated videos to source links
+        sources = [f"[{title}]({link}&t={start_sec})"
+                   for link, (title, start_sec) in video_timestamps.items()]
+
     # Compose messages to send to OpenAI
-    final_messages = [{"role": "system", "content": system_prompt}] + messages
-    final_messages.append({
-        "role": "user",
-        "content": f"""Context:\n{context}\n\nBased on this context, please answer the above conversation."""
-    })
+    final_messages = [
+        system_message,
+        *({"role": m.role, "content": m.content} for m in messages),
+    ]
+    if not is_task:
+        final_messages.append({
+            "role": "user",
+            "content": f"""Context:\n{context}\n\nBased on this context, please answer the above conversation."""
+        })
 
-    # Send to LLM
+    # Send to LLM, passing tokens through as they arrive
+    answer_parts = []
     try:
-        chat = client.chat.completions.create(
+        # The stream only releases its HTTP response when drained or closed,
+        # so close it if the client disconnects or the stream errors midway
+        async with await client.chat.completions.create(
             model="gpt-4o-mini",
             messages=final_messages,
-            temperature=0.3
-        )
-        answer = chat.choices[0].message.content
+            temperature=0.3,
+            stream=True
+        ) as chat:
+            async for chunk in chat:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    answer_parts.append(delta)
+                    yield delta
     except Exception as e:
         logger.error(f"OpenAI text query error: {e}")
-        return "Sorry, I couldn't process your request... (Backend Error - LLM)"
+        # Don't pass a truncated answer off as a complete one
+        if answer_parts:
+            raise
+        yield "Sorry, I couldn't process your request... (Backend Error - LLM)"
+        return
+    answer = "".join(answer_parts)
 
     # Check if we should include sources
     should_include_sources = True
     
     # Check if the user query is a system prompt
-    if user_message.strip().startswith('### Task:'):
+    if is_task:
         should_include_sources = False
     
     # Check if the answer contains any of the specific responses
     answer_lower = answer.lower()
-    if any(phrase in answer_lower for phrase in [
-        'assalamualaikum',
-        'wailikum assalam',
-        'allah and his messenger know best',
-        'that\'s not important — what truly matters is who created us all'
-    ]):
+    if any(phrase in answer_lower for phrase in _CANNED_PHRASES):
         should_include_sources = False
 
     if sources and should_include_sources:
         inline, footnotes = format_citations(sources)
-        answer = f"{answer} {inline}\n{footnotes}"
+        citations = f" {inline}\n{footnotes}"
+        answer += citations
+        yield citations
 
-    # Log the exchange
-    log_exchange(user_message, context, answer)
+    # Log the exchange (task prompts are internal, not user questions)
+    if not is_task:
+        log_exchange(query, context, answer)
 
-    return answer
+# Function called by the router to answer user text queries in one piece
+async def answer_query(messages: Sequence[ChatMessage], **kwargs) -> str:
+    return "".join([part async for part in stream_answer(messages, **kwargs)])
 
-# Function to log the chat history to a CSV file
-'''
-def log_exchange(question: str, context: str, answer: str) -> None:
-    """Append one row to chat_history.csv with headers if file doesn't exist."""
-    
-    file_exists = os.path.isfile("chat_history.csv")
-    
-    with open("chat_history.csv", "a", newline="", encoding="utf-8") as f:
+# Chat history logging: exchanges are queued from the request path and a
+# background task started with the app appends them to the CSV in batches.
+# Off by default since answers can echo what the user typed; when enabled,
+# the anonymized query is logged rather than the raw user message.
+YQ_LOG_CHAT_HISTORY = os.getenv("YQ_LOG_CHAT_HISTORY", "False").lower() == "true"
+CHAT_HISTORY_FILE = os.getenv("YQ_CHAT_HISTORY_FILE", "chat_history.csv")
+LOG_FLUSH_INTERVAL = 0.5
+LOG_FLUSH_ROWS = 100
+
+_log_queue = None
+_log_task = None
+
+def write_chat_history(rows: list) -> None:
+    """Append rows to chat_history.csv with headers if file doesn't exist."""
+
+    file_exists = os.path.isfile(CHAT_HISTORY_FILE)
+
+    with open(CHAT_HISTORY_FILE, "a", newline="", encoding="utf-8") as f:
         writer = csv.writer(f)
         if not file_exists:
             writer.writerow(["Question", "Context", "Answer"])
-        writer.writerow([question, context, answer])
-'''
+        writer.writerows(rows)
+
+async def chat_history_writer() -> None:
+    # A None row asks the writer to flush and exit
+    while True:
+        rows = [await _log_queue.get()]
+        await fill_batch(_log_queue, rows, LOG_FLUSH_ROWS, LOG_FLUSH_INTERVAL)
+        stopping = None in rows
+        rows = [row for row in rows if row is not None]
+        if rows:
+            try:
+                await anyio.to_thread.run_sync(write_chat_history, rows)
+            except OSError as e:
+                logger.error(f"Chat history write error: {e}")
+        if stopping:
+            return
+
+def start_log_writer() -> None:
+    global _log_queue, _log_task
+    if not YQ_LOG_CHAT_HISTORY:
+        return
+    if _log_task is None or _log_task.done():
+        _log_queue = asyncio.Queue()
+        _log_task = asyncio.create_task(chat_history_writer())
+
+async def stop_log_writer() -> None:
+    global _log_task
+    if _log_task is None:
+        return
+    _log_queue.put_nowait(None)
+    await _log_task
+    _log_task = None
+
+# Function to log the chat history to a CSV file
+def log_exchange(question: str, context: str, answer: str) -> None:
+    if not YQ_LOG_CHAT_HISTORY:
+        return
+    if _log_task is None:
+        start_log_writer()
+    _log_queue.put_nowait((question, context, answer))
 
 def format_citations(urls: list[str]) -> tuple[str, str]:
     if not urls:
@@ -215,58 +629,106 @@ def format_citations(urls: list[str]) -> tuple[str, str]:
     return "", footer
 
 # === OpenAI-compatible chat/completions endpoint ===
-class ChatMessage(BaseModel):
-    role: str
-    content: str
-
 class ChatCompletionRequest(BaseModel):
     model: str
     messages: List[ChatMessage]
     temperature: float = 0.3
+    stream: bool = False
 
-@router.post("/chat/completions", tags=["OpenAI Compatibility"])
-async def chat_completion(request_data: ChatCompletionRequest, api_key: str = Depends(get_api_key)):
-    messages = [m.dict() for m in request_data.messages]
-    try:
-        answer = answer_query(messages)
-    except Exception as e:
-        logger.error(f"LLM error: {e}")
-        raise HTTPException(500, f"LLM error: {str(e)}")
-
-    return {
+# Function to format an OpenAI-style server-sent chat.completion.chunk event
+def chat_completion_chunk(model: str, delta: dict, finish_reason: Optional[str] = None) -> str:
+    chunk = {
         "id": "chatcmpl-local-001",
-        "object": "chat.completion",
+        "object": "chat.completion.chunk",
         "created": 0,
-        "model": request_data.model,
+        "model": model,
         "choices": [
             {
                 "index": 0,
-                "message": {
-                    "role": "assistant",
-                    "content": answer
-                },
-                "finish_reason": "stop"
+                "delta": delta,
+                "finish_reason": finish_reason
             }
-        ],
-        "usage": {
-            "prompt_tokens": 0,
-            "completion_tokens": 0,
-            "total_tokens": 0
-        }
+        ]
     }
+    return f"data: {orjson.dumps(chunk).decode()}\n\n"
 
-# === OpenAI-compatible models endpoint ===
-@router.get("/models", tags=["OpenAI Compatibility"])
-async def get_models():
-    return {
-        "object": "list",
-        "data": [
-            {
-                "id": "YQ Answers",
-                "object": "model",
-                "created": 1715200000,
-                "owned_by": "local",
-                "permission": [],
-            },
-        ]
+async def stream_chat_completion(
+    model: str, messages: Sequence[ChatMessage], **kwargs
+) -> AsyncIterator[str]:
+    yield chat_completion_chunk(model, {"role": "assistant"})
+    try:
+        async for part in stream_answer(messages, **kwargs):
+            yield chat_completion_chunk(model, {"content": part})
+    except Exception as e:
+        logger.error(f"LLM error: {e}")
+        yield chat_completion_chunk(
+            model, {"content": "Sorry, I couldn't process your request... (Backend Error)"}
+        )
+    yield chat_completion_chunk(model, {}, "stop")
+    yield "data: [DONE]\n\n"
+
+# Function to build the OpenAI-compatible router answering from one Pinecone
+# index; the OpenAI and Pinecone clients and the PII engines are shared
+def make_router(index_name: str, system_prompt: str) -> APIRouter:
+    router = APIRouter()
+    answer_options = {
+        "index_name": index_name,
+        "system_message": {"role": "system", "content": system_prompt},
     }
+
+    @router.post("/chat/completions", tags=["OpenAI Compatibility"], response_class=ORJSONResponse)
+    async def chat_completion(request_data: ChatCompletionRequest, api_key: str = Depends(get_api_key)):
+        messages = request_data.messages
+        if request_data.stream:
+            return StreamingResponse(
+                stream_chat_completion(request_data.model, messages, **answer_options),
+                media_type="text/event-stream"
+            )
+
+        try:
+            answer = await answer_query(messages, **answer_options)
+        except Exception as e:
+            logger.error(f"LLM error: {e}")
+            raise HTTPException(500, f"LLM error: {str(e)}")
+
+        return {
+            "id": "chatcmpl-local-001",
+            "object": "chat.completion",
+            "created": 0,
+            "model": request_data.model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "content": answer
+                    },
+                    "finish_reason": "stop"
+                }
+            ],
+            "usage": {
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "total_tokens": 0
+            }
+        }
+
+    # === OpenAI-compatible models endpoint ===
+    @router.get("/models", tags=["OpenAI Compatibility"], response_class=ORJSONResponse)
+    async def get_models():
+        return {
+            "object": "list",
+            "data": [
+                {
+                    "id": "YQ Answers",
+                    "object": "model",
+                    "created": 1715200000,
+                    "owned_by": "local",
+                    "permission": [],
+                },
+            ]
+        }
+
+    return router
+
+router = make_router(PINECONE_INDEX_NAME, SYSTEM_PROMPT)
@@ -0,0 +1,348 @@
+import asyncio
+import csv
+import os
+from concurrent.futures import Executor, Future
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+
+import pytest
+
+# The module builds its OpenAI and Pinecone clients at import time
+os.environ.setdefault("YQ_OPENAI_API_KEY", "test")
+os.environ.setdefault("YQ_PINECONE_API_KEY", "test")
+
+from open_webui.routers import yq_answers
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("email me at a.b@example.com", "email me at <EMAIL_ADDRESS>"),
+        ("my ssn is 123-45-6789", "my ssn is <US_SSN>"),
+        ("card 4111 1111 1111 1111", "card <CREDIT_CARD>"),
+        ("card 5500-0055-5555-5559", "card <CREDIT_CARD>"),
+        ("from 192.168.0.1", "from <IP_ADDRESS>"),
+        ("call (555) 123-4567", "call <PHONE_NUMBER>"),
+        ("call 555-123-4567", "call <PHONE_NUMBER>"),
+        ("call +1 555 123 4567", "call <PHONE_NUMBER>"),
+        ("iban GB82 WEST 1234 5698 7654 32", "iban <IBAN_CODE>"),
+    ],
+)
+def test_anonymize_text_replaces_pii(monkeypatch, text, expected):
+    monkeypatch.setattr(yq_answers, "YQ_PII_USE_PRESIDIO", False)
+    assert yq_answers.anonymize_text(text) == expected
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "year 1441 1442 1443 1444",
+        "ISBN 9780123456789",
+        "Hadith 1234567890",
+        "Surah 2:255 was revealed in Madinah",
+        "What did the Prophet say about fasting in 1999?",
+    ],
+)
+def test_anonymize_text_keeps_non_pii(monkeypatch, text):
+    monkeypatch.setattr(yq_answers, "YQ_PII_USE_PRESIDIO", False)
+    assert yq_answers.anonymize_text(text) == text
+
+
+def test_luhn_valid():
+    assert yq_answers.luhn_valid("4111 1111 1111 1111")
+    assert yq_answers.luhn_valid("378282246310005")
+    assert not yq_answers.luhn_valid("1441144214431444")
+    assert not yq_answers.luhn_valid("9780123456789")
+
+
+class FakeEmbeddings:
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+
+    async def create(self, model, input, **kwargs):
+        self.calls.append(list(input))
+        if self.error:
+            raise self.error
+        return SimpleNamespace(
+            data=[
+                SimpleNamespace(index=i, embedding=[float(len(query))])
+                for i, query in enumerate(input)
+            ]
+        )
+
+
+def fake_client(embeddings):
+    return SimpleNamespace(embeddings=embeddings)
+
+
+def test_embedding_batcher_batches_concurrent_queries(monkeypatch):
+    embeddings = FakeEmbeddings()
+    monkeypatch.setattr(yq_answers, "client", fake_client(embeddings))
+
+    async def run():
+        batcher = yq_answers.EmbeddingBatcher(max_batch_size=32, max_wait=0.05)
+        try:
+            return await asyncio.gather(*(batcher.submit("x" * i) for i in range(40)))
+        finally:
+            await batcher.close()
+
+    results = asyncio.run(run())
+    assert [len(call) for call in embeddings.calls] == [32, 8]
+    assert results == [[float(i)] for i in range(40)]
+
+
+def test_embedding_batcher_flushes_lone_query_after_max_wait(monkeypatch):
+    embeddings = FakeEmbeddings()
+    monkeypatch.setattr(yq_answers, "client", fake_client(embeddings))
+
+    async def run():
+        batcher = yq_answers.EmbeddingBatcher(max_wait=0.01)
+        try:
+            return await asyncio.wait_for(batcher.submit("abc"), timeout=1)
+        finally:
+            await batcher.close()
+
+    assert asyncio.run(run()) == [3.0]
+    assert embeddings.calls == [["abc"]]
+
+
+def test_embedding_batcher_propagates_errors(monkeypatch):
+    embeddings = FakeEmbeddings(error=RuntimeError("boom"))
+    monkeypatch.setattr(yq_answers, "client", fake_client(embeddings))
+
+    async def run():
+        batcher = yq_answers.EmbeddingBatcher(max_wait=0.01)
+        try:
+            return await asyncio.gather(
+                batcher.submit("a"), batcher.submit("b"), return_exceptions=True
+            )
+        finally:
+            await batcher.close()
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_embedding_batcher_close_stops_collector(monkeypatch):
+    monkeypatch.setattr(yq_answers, "client", fake_client(FakeEmbeddings()))
+
+    async def run():
+        batcher = yq_answers.EmbeddingBatcher(max_wait=0.01)
+        await batcher.submit("a")
+        task = batcher._task
+        await batcher.close()
+        return task
+
+    task = asyncio.run(run())
+    assert task.cancelled()
+
+
+def test_fill_batch_stops_at_max_size():
+    async def run():
+        queue = asyncio.Queue()
+        for i in range(10):
+            queue.put_nowait(i)
+        batch = [await queue.get()]
+        await yq_answers.fill_batch(queue, batch, max_size=4, max_wait=1)
+        return batch, queue.qsize()
+
+    assert asyncio.run(run()) == ([0, 1, 2, 3], 6)
+
+
+def test_fill_batch_stops_after_max_wait():
+    async def run():
+        queue = asyncio.Queue()
+        batch = ["first"]
+        await asyncio.wait_for(
+            yq_answers.fill_batch(queue, batch, max_size=4, max_wait=0.01), timeout=1
+        )
+        return batch
+
+    assert asyncio.run(run()) == ["first"]
+
+
+def read_chat_history(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+def test_write_chat_history_writes_header_once(monkeypatch, tmp_path):
+    path = tmp_path / "chat_history.csv"
+    monkeypatch.setattr(yq_answers, "CHAT_HISTORY_FILE", str(path))
+
+    yq_answers.write_chat_history([("q1", "c1", "a1")])
+    yq_answers.write_chat_history([("q2", "c2", "a2"), ("q3", "c3", "a3")])
+
+    assert read_chat_history(path) == [
+        ["Question", "Context", "Answer"],
+        ["q1", "c1", "a1"],
+        ["q2", "c2", "a2"],
+        ["q3", "c3", "a3"],
+    ]
+
+
+def test_chat_history_writer_flushes_queued_rows_on_stop(monkeypatch, tmp_path):
+    path = tmp_path / "chat_history.csv"
+    monkeypatch.setattr(yq_answers, "CHAT_HISTORY_FILE", str(path))
+    monkeypatch.setattr(yq_answers, "YQ_LOG_CHAT_HISTORY", True)
+
+    async def run():
+        yq_answers.start_log_writer()
+        for i in range(250):
+            yq_answers.log_exchange(f"q{i}", "c", "a")
+        await asyncio.sleep(0)
+        yq_answers.log_exchange("last", "c", "a")
+        await asyncio.wait_for(yq_answers.stop_log_writer(), timeout=5)
+
+    asyncio.run(run())
+    rows = read_chat_history(path)
+    assert rows[0] == ["Question", "Context", "Answer"]
+    assert [row[0] for row in rows[1:]] == [f"q{i}" for i in range(250)] + ["last"]
+    assert yq_answers._log_queue.empty()
+
+
+def test_log_exchange_is_disabled_by_default(monkeypatch, tmp_path):
+    path = tmp_path / "chat_history.csv"
+    monkeypatch.setattr(yq_answers, "CHAT_HISTORY_FILE", str(path))
+    monkeypatch.setattr(yq_answers, "YQ_LOG_CHAT_HISTORY", False)
+
+    async def run():
+        yq_answers.start_log_writer()
+        yq_answers.log_exchange("q", "c", "a")
+        await yq_answers.stop_log_writer()
+
+    asyncio.run(run())
+    assert not path.exists()
+
+
+def delta_chunk(content):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+class FakeChatStream:
+    def __init__(self, chunks, error=None):
+        self.chunks = chunks
+        self.error = error
+        self.closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        self.closed = True
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield chunk
+        if self.error:
+            raise self.error
+
+
+class FakeChatCompletions:
+    def __init__(self, chunks, error=None):
+        self.stream = FakeChatStream(chunks, error)
+
+    async def create(self, **kwargs):
+        return self.stream
+
+
+class FailingChatCompletions(FakeChatCompletions):
+    def __init__(self):
+        super().__init__([delta_chunk("Partial")], RuntimeError("connection reset"))
+
+
+TASK_MESSAGES = [yq_answers.ChatMessage(role="user", content="### Task: title this chat")]
+
+
+def test_answer_query_raises_when_stream_breaks(monkeypatch):
+    monkeypatch.setattr(
+        yq_answers, "client", SimpleNamespace(chat=SimpleNamespace(completions=FailingChatCompletions()))
+    )
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(yq_answers.answer_query(TASK_MESSAGES))
+
+
+def test_stream_chat_completion_reports_broken_stream(monkeypatch):
+    monkeypatch.setattr(
+        yq_answers, "client", SimpleNamespace(chat=SimpleNamespace(completions=FailingChatCompletions()))
+    )
+
+    async def run():
+        return [chunk async for chunk in yq_answers.stream_chat_completion("m", TASK_MESSAGES)]
+
+    chunks = asyncio.run(run())
+    assert '"Partial"' in chunks[1]
+    assert "Backend Error" in chunks[2]
+    assert chunks[-1] == "data: [DONE]\n\n"
+
+
+class FakePool(Executor):
+    def __init__(self, broken=False, **kwargs):
+        self.broken = broken
+        self.is_shutdown = False
+
+    def submit(self, fn, *args):
+        future = Future()
+        if self.broken:
+            future.set_exception(BrokenProcessPool("worker died"))
+        else:
+            future.set_result(fn(*args))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.is_shutdown = True
+
+
+def test_anonymize_query_rebuilds_broken_pii_pool(monkeypatch):
+    broken = FakePool(broken=True)
+    created = []
+
+    def make_pool(**kwargs):
+        pool = FakePool(**kwargs)
+        created.append(pool)
+        return pool
+
+    monkeypatch.setattr(yq_answers, "YQ_PII_USE_PRESIDIO", True)
+    monkeypatch.setattr(yq_answers, "anonymize_text", lambda text: f"anon:{text}")
+    monkeypatch.setattr(yq_answers, "ProcessPoolExecutor", make_pool)
+    monkeypatch.setattr(yq_answers, "_pii_pool", broken)
+
+    assert asyncio.run(yq_answers.anonymize_query("q")) == "anon:q"
+    assert broken.is_shutdown
+    assert len(created) == 1 and yq_answers._pii_pool is created[0]
+
+    yq_answers.shutdown_pii_pool()
+    assert created[0].is_shutdown
+    assert yq_answers._pii_pool is None
+
+
+def test_stream_answer_closes_llm_stream_on_early_exit(monkeypatch):
+    completions = FakeChatCompletions([delta_chunk("First"), delta_chunk("Second")])
+    monkeypatch.setattr(
+        yq_answers, "client", SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    )
+
+    async def run():
+        stream = yq_answers.stream_answer(TASK_MESSAGES)
+        first = await stream.__anext__()
+        await stream.aclose()
+        return first
+
+    assert asyncio.run(run()) == "First"
+    assert completions.stream.closed
+
+
+def test_stream_answer_closes_llm_stream_on_error(monkeypatch):
+    completions = FailingChatCompletions()
+    monkeypatch.setattr(
+        yq_answers, "client", SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    )
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(yq_answers.answer_query(TASK_MESSAGES))
+    assert completions.stream.closed